@@ -1,14 +1,32 @@
 import streamlit as st
 import os
 import tempfile
+import hashlib
 from datetime import datetime
-from concurrent.futures import ThreadPoolExecutor, as_completed
-import PyPDF2
-from io import BytesIO
+import asyncio
+import threading
+import pymupdf
 from dotenv import load_dotenv
 
 # Import your custom agents
-from utils.Agents import Cardiologist, Psychologist, Pulmonologist, MultidisciplinaryTeam
+from utils.Helpers import (
+    NOT_CONSULTED_REPORT, MODEL_NAME, SMALL_MODEL_NAME,
+    select_specialties, select_model_name, is_report_too_short, format_report
+)
+from utils.PdfCache import extract_with_disk_cache
+from utils.Agents import Cardiologist, Psychologist, Pulmonologist, MultidisciplinaryTeam, SpecialistPanel, build_report_cache, delete_report_cache, create_model, warm_up_model
+
+SPECIALISTS = {
+    "Cardiologist": Cardiologist,
+    "Psychologist": Psychologist,
+    "Pulmonologist": Pulmonologist
+}
+
+# Bounds for the in-memory caches of report text, formatted analyses and model clients
+CACHE_MAX_ENTRIES = 32
+CACHE_TTL_SECONDS = 60 * 60
+
+MODEL_OPTIONS = ["Auto", SMALL_MODEL_NAME, MODEL_NAME, "gemini-1.5-pro"]
 
 # Page configuration
 st.set_page_config(
@@ -19,7 +37,7 @@ st.set_page_config(
 )
 
 # Custom CSS for better styling
-st.markdown("""
+CUSTOM_CSS = """
 <style>
     .main-header {
         text-align: center;
@@ -46,7 +64,53 @@ st.markdown("""
         margin: 1rem 0;
     }
 </style>
-""", unsafe_allow_html=True)
+"""
+
+HEADER_HTML = """
+<div class="main-header">
+    <h1>🏥 AI Medical Report Analysis</h1>
+    <p>Advanced Multi-Specialist Medical Report Analysis System</p>
+</div>
+"""
+
+FOOTER_HTML = """
+<div style='text-align: center; color: #666;'>
+    <p>🏥 AI Medical Report Analysis System | Powered by Google Gemini AI</p>
+    <p><small>⚠️ This tool is for educational purposes only. Always consult with qualified healthcare professionals for medical advice.</small></p>
+</div>
+"""
+
+# Inject the stylesheet directly as HTML, skipping the Markdown parser
+st.html(CUSTOM_CSS)
+
+@st.cache_resource
+def _warmed_up_keys():
+    """SHA-256 digests of the API keys whose shared clients are warm or warming up"""
+    return set()
+
+def _warmup(api_key):
+    """Warm up the shared Gemini clients once per API key, off the script thread.
+
+    Only the synchronous clients from get_model are warmed, which serve the
+    multidisciplinary team and combined specialist calls. The streaming
+    specialists use an async client created for each run (asyncio.run closes
+    its loop), so their first requests still open a fresh connection, and so
+    does any model picked from the sidebar override.
+    """
+    warmed = _warmed_up_keys()
+    # Keep only a digest so raw API keys don't live in process-wide state
+    key_digest = hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+    if key_digest in warmed:
+        return
+    warmed.add(key_digest)
+    models = [get_model(api_key, name) for name in (SMALL_MODEL_NAME, MODEL_NAME)]
+    
+    def warm_up():
+        if not all([warm_up_model(model) for model in models]):
+            # Let a later rerun try again
+            warmed.discard(key_digest)
+    
+    threading.Thread(target=warm_up, daemon=True).start()
 
 def load_api_key():
     """Load API key from environment or user input"""
@@ -72,102 +136,241 @@ def load_api_key():
     else:
         st.session_state['api_key'] = api_key
     
+    # Pay the connection setup cost of the team/panel client now rather than
+    # after the specialists finish
+    _warmup(api_key)
+    
     return api_key
 
+def _parse_pdf(pdf_bytes):
+    """Extract text from raw PDF bytes"""
+    with pymupdf.open(stream=pdf_bytes, filetype="pdf") as doc:
+        return "\n".join(page.get_text("text") for page in doc).strip()
+
+@st.cache_data(show_spinner=False, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL_SECONDS)
+def _extract_pdf_bytes(pdf_bytes):
+    """Extract text from raw PDF bytes (cached in memory and optionally on disk)"""
+    return extract_with_disk_cache(pdf_bytes, _parse_pdf)
+
+@st.cache_data(show_spinner=False, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL_SECONDS)
+def _read_txt(txt_bytes):
+    """Decode raw TXT bytes (cached on the file contents)"""
+    return str(txt_bytes, "utf-8")
+
+def extract_text_from_txt(txt_file):
+    """Extract text from uploaded TXT file"""
+    try:
+        return _read_txt(txt_file.getvalue())
+    except UnicodeDecodeError as e:
+        st.error(f"Error reading TXT file: {str(e)}")
+        return None
+
 def extract_text_from_pdf(pdf_file):
     """Extract text from uploaded PDF file"""
     try:
-        pdf_reader = PyPDF2.PdfReader(BytesIO(pdf_file.read()))
-        text = ""
-        for page in pdf_reader.pages:
-            text += page.extract_text() + "\n"
-        return text.strip()
+        return _extract_pdf_bytes(pdf_file.getvalue())
+    except pymupdf.FileDataError as e:
+        st.error(f"Invalid or corrupted PDF file: {str(e)}")
+        return None
     except Exception as e:
         st.error(f"Error reading PDF file: {str(e)}")
         return None
 
-def process_medical_report(medical_report, api_key):
+@st.cache_resource(max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL_SECONDS)
+def get_model(api_key, model_name=MODEL_NAME):
+    """Synchronous Gemini model client shared by the team and panel agents across reruns"""
+    return create_model(api_key, model_name)
+
+def process_medical_report(medical_report, api_key, model_name=MODEL_NAME, combined=False):
     """Process the medical report using the AI agents"""
     
-    # Initialize progress bar
-    progress_bar = st.progress(0)
-    status_text = st.empty()
+    # Don't spend API quota on reports with nothing to analyze
+    if is_report_too_short(medical_report):
+        st.error("Error: The medical report is empty or too short to analyze.")
+        return None, None
+    
+    # Single status element for the whole run, updated in place
+    status = st.status("Initializing AI agents...")
     
     try:
-        # Initialize agents
-        status_text.text("Initializing AI agents...")
-        progress_bar.progress(10)
-        
-        agents = {
-            "Cardiologist": Cardiologist(medical_report, api_key=api_key),
-            "Psychologist": Psychologist(medical_report, api_key=api_key),
-            "Pulmonologist": Pulmonologist(medical_report, api_key=api_key)
-        }
-        
-        progress_bar.progress(20)
+        # Only consult the specialists whose field the report touches; if the
+        # keywords match nothing, fall back to consulting all of them
+        active = select_specialties(medical_report)
         
-        # Function to run each agent and get their response
-        def get_response(agent_name, agent):
-            response = agent.run()
-            if response is None:
-                st.warning(f"Warning: {agent_name} failed to generate a response, likely due to API issues.")
-            return agent_name, response
+        model = get_model(api_key, model_name)
+        responses = {name: NOT_CONSULTED_REPORT for name in SPECIALISTS if name not in active}
         
-        # Run the agents concurrently and collect responses
-        status_text.text("Running specialist consultations...")
-        responses = {}
-        
-        with ThreadPoolExecutor() as executor:
-            futures = {executor.submit(get_response, name, agent): name for name, agent in agents.items()}
+        if combined:
+            # One structured request answers for every active specialist, so
+            # the report is only sent once (no live streaming in this mode)
+            status.update(label="Running combined specialist consultation...")
+            panel = SpecialistPanel(medical_report, active, api_key=api_key, model=model)
+            panel_reports = panel.run() or {}
+            for name in active:
+                responses[name] = panel_reports.get(name) or None
+        else:
+            # Cache the shared report once so the specialists don't each re-send it
+            cached_content = build_report_cache(medical_report, api_key=api_key, model_name=model_name)
+            
+            # The specialists stream on a fresh asyncio loop each run. The async
+            # client is bound to the loop it first ran on, so they get their own
+            # client rather than the shared one from get_model
+            async_model = create_model(api_key, model_name, cached_content=cached_content)
+            agents = {
+                name: SPECIALISTS[name](medical_report, api_key=api_key, cached_content=cached_content, model=async_model)
+                for name in active
+            }
+            
+            # Live view of the specialist reports while they are being generated
+            live_section = st.empty()
+            placeholders = {}
+            with live_section.container():
+                for name in agents:
+                    with st.expander(f"{name} Analysis (live)", expanded=True):
+                        placeholders[name] = st.empty()
             
-            completed = 0
-            for future in as_completed(futures):
-                agent_name, response = future.result()
-                responses[agent_name] = response
-                completed += 1
-                progress_bar.progress(20 + (completed * 20))
-                status_text.text(f"Completed {agent_name} analysis...")
+            # Coroutine to stream each agent's response. The event loop runs on the
+            # script thread, so placeholders can be updated directly as chunks arrive
+            async def stream_response(agent_name, agent):
+                text = ""
+                try:
+                    async for chunk in agent.arun_stream():
+                        text += chunk
+                        placeholders[agent_name].markdown(text)
+                except Exception:
+                    # A stream that breaks midway is a failed agent, not a short answer
+                    return agent_name, None
+                return agent_name, text or None
+            
+            async def run_specialists():
+                tasks = [asyncio.create_task(stream_response(name, agent)) for name, agent in agents.items()]
+                completed = 0
+                for next_done in asyncio.as_completed(tasks):
+                    agent_name, response = await next_done
+                    responses[agent_name] = response
+                    if response is None:
+                        # Fail fast: the analysis can't complete, so stop the
+                        # remaining specialists instead of waiting on them
+                        st.warning(f"Warning: {agent_name} failed to generate a response, likely due to API issues.")
+                        for task in tasks:
+                            task.cancel()
+                        return
+                    completed += 1
+                    status.update(label=f"Completed {agent_name} analysis ({completed}/{len(agents)})...")
+            
+            # Run the agents concurrently and render their output as it arrives
+            status.update(label="Running specialist consultations...")
+            try:
+                asyncio.run(run_specialists())
+            finally:
+                # Don't leave the report on Google's servers until the TTL expires
+                if cached_content:
+                    delete_report_cache(cached_content, api_key=api_key)
+            
+            live_section.empty()
         
         # Check if any agent responses are None
         if None in responses.values():
+            status.update(label="Specialist consultations failed", state="error")
             st.error("Error: One or more agents failed to generate a response. Check API key and quota.")
             return None, None
         
-        progress_bar.progress(80)
-        status_text.text("Generating multidisciplinary team analysis...")
+        status.update(label="Generating multidisciplinary team analysis...")
         
         # Run the MultidisciplinaryTeam agent to generate the final diagnosis
         team_agent = MultidisciplinaryTeam(
             cardiologist_report=responses["Cardiologist"],
             psychologist_report=responses["Psychologist"],
             pulmonologist_report=responses["Pulmonologist"],
-            api_key=api_key
+            api_key=api_key,
+            model=model
         )
         
-        final_diagnosis = team_agent.run()
+        # Stream the team's analysis as it is generated, then clear it so the
+        # formatted result section can take over
+        stream_placeholder = st.empty()
+        try:
+            final_diagnosis = stream_placeholder.write_stream(team_agent.run_stream()) or None
+        except Exception:
+            # Never keep a diagnosis from a stream that broke midway
+            final_diagnosis = None
+        stream_placeholder.empty()
         
         if final_diagnosis is None:
+            status.update(label="Multidisciplinary team analysis failed", state="error")
             st.error("Error: MultidisciplinaryTeam failed to generate a final diagnosis.")
             return None, None
         
-        progress_bar.progress(100)
-        status_text.text("Analysis completed successfully!")
+        status.update(label="Analysis completed successfully!", state="complete")
         
         return responses, final_diagnosis
         
     except Exception as e:
+        status.update(label="Analysis failed", state="error")
         st.error(f"An error occurred during processing: {str(e)}")
         return None, None
 
-def main():
-    # Header
-    st.markdown("""
-    <div class="main-header">
-        <h1>🏥 AI Medical Report Analysis</h1>
-        <p>Advanced Multi-Specialist Medical Report Analysis System</p>
+@st.cache_data(show_spinner=False, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL_SECONDS)
+def _format_report(responses, final_diagnosis, timestamp_str):
+    """Build the downloadable analysis report text (cached across reruns)"""
+    return format_report(responses, final_diagnosis, timestamp_str)
+
+@st.fragment
+def _results_fragment(responses, final_diagnosis):
+    """Render the analysis results; widget clicks here only rerun this fragment"""
+    # Display individual specialist reports
+    st.subheader("👨‍⚕️ Specialist Reports")
+    
+    # Cardiologist Report
+    with st.expander("🫀 Cardiologist Analysis"):
+        st.write(responses.get("Cardiologist", "No response"))
+    
+    # Psychologist Report
+    with st.expander("🧠 Psychologist Analysis"):
+        st.write(responses.get("Psychologist", "No response"))
+    
+    # Pulmonologist Report
+    with st.expander("🫁 Pulmonologist Analysis"):
+        st.write(responses.get("Pulmonologist", "No response"))
+    
+    # Final Diagnosis
+    st.subheader("🏆 Final Multidisciplinary Analysis")
+    st.markdown(f"""
+    <div class="result-section">
+        {final_diagnosis}
     </div>
     """, unsafe_allow_html=True)
     
+    # Prepare downloadable content
+    generated_at = st.session_state['analysis_timestamp']
+    timestamp = generated_at.strftime("%Y%m%d_%H%M%S")
+    download_content = _format_report(
+        responses,
+        final_diagnosis,
+        generated_at.strftime("%Y-%m-%d %H:%M:%S")
+    )
+    
+    # Download button
+    st.download_button(
+        label="📥 Download Analysis Report",
+        data=download_content,
+        file_name=f"medical_analysis_{timestamp}.txt",
+        mime="text/plain",
+        type="primary",
+        use_container_width=True
+    )
+    
+    # Reset session state
+    if st.button("🔄 Analyze Another Report", use_container_width=True):
+        for key in list(st.session_state.keys()):
+            if key.startswith('analysis') or key == 'medical_report':
+                del st.session_state[key]
+        st.rerun()
+
+def main():
+    # Header
+    st.html(HEADER_HTML)
+    
     # Load API key
     api_key = load_api_key()
     
@@ -185,6 +388,17 @@ def main():
     - **Multidisciplinary Team**: Comprehensive diagnosis
     """)
     
+    st.sidebar.header("⚙️ Model")
+    model_override = st.sidebar.selectbox(
+        "Gemini model:",
+        MODEL_OPTIONS,
+        help=f"Auto uses {SMALL_MODEL_NAME} for short reports and {MODEL_NAME} otherwise"
+    )
+    combined = st.sidebar.toggle(
+        "Combine specialist requests",
+        help="Ask all specialists in a single request so the report is only sent once. Specialist reports are not streamed in this mode."
+    )
+    
     # Main content area
     col1, col2 = st.columns([1, 1])
     
@@ -208,7 +422,7 @@ def main():
             # Process the uploaded file
             if uploaded_file.type == "text/plain":
                 # Handle TXT file
-                medical_report_text = str(uploaded_file.read(), "utf-8")
+                medical_report_text = extract_text_from_txt(uploaded_file)
             elif uploaded_file.type == "application/pdf":
                 # Handle PDF file
                 medical_report_text = extract_text_from_pdf(uploaded_file)
@@ -222,98 +436,50 @@ def main():
                 if st.button("🔍 Start Analysis", type="primary", use_container_width=True):
                     st.session_state['analysis_started'] = True
                     st.session_state['medical_report'] = medical_report_text
+                    # Sidebar settings only apply to the analysis started here,
+                    # so changing them later doesn't silently start a new one
+                    st.session_state['analysis_model_name'] = select_model_name(medical_report_text, model_override)
+                    st.session_state['analysis_combined'] = combined
     
     with col2:
         st.header("📊 Analysis Results")
         
         if 'analysis_started' in st.session_state and st.session_state['analysis_started']:
-            # Process the medical report
-            responses, final_diagnosis = process_medical_report(
-                st.session_state['medical_report'], 
-                api_key
-            )
+            model_name = st.session_state['analysis_model_name']
+            combined = st.session_state['analysis_combined']
             
-            if responses and final_diagnosis:
-                # Display individual specialist reports
-                st.subheader("👨‍⚕️ Specialist Reports")
-                
-                # Cardiologist Report
-                with st.expander("🫀 Cardiologist Analysis"):
-                    st.write(responses.get("Cardiologist", "No response"))
-                
-                # Psychologist Report
-                with st.expander("🧠 Psychologist Analysis"):
-                    st.write(responses.get("Psychologist", "No response"))
-                
-                # Pulmonologist Report
-                with st.expander("🫁 Pulmonologist Analysis"):
-                    st.write(responses.get("Pulmonologist", "No response"))
-                
-                # Final Diagnosis
-                st.subheader("🏆 Final Multidisciplinary Analysis")
-                st.markdown(f"""
-                <div class="result-section">
-                    {final_diagnosis}
-                </div>
-                """, unsafe_allow_html=True)
-                
-                # Prepare downloadable content
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                
-                download_content = f"""
-MEDICAL REPORT ANALYSIS
-Generated on: {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
-{'='*50}
-
-CARDIOLOGIST ANALYSIS:
-{responses.get("Cardiologist", "No response")}
-
-{'='*50}
-
-PSYCHOLOGIST ANALYSIS:
-{responses.get("Psychologist", "No response")}
-
-{'='*50}
-
-PULMONOLOGIST ANALYSIS:
-{responses.get("Pulmonologist", "No response")}
-
-{'='*50}
-
-FINAL MULTIDISCIPLINARY TEAM ANALYSIS:
-{final_diagnosis}
-
-{'='*50}
-End of Report
-                """
-                
-                # Download button
-                st.download_button(
-                    label="📥 Download Analysis Report",
-                    data=download_content,
-                    file_name=f"medical_analysis_{timestamp}.txt",
-                    mime="text/plain",
-                    type="primary",
-                    use_container_width=True
+            # Reuse the previous analysis on reruns (downloads, expanders) so the
+            # agents are only invoked once per report, API key and model settings
+            analysis_hash = hash((st.session_state['medical_report'], api_key, model_name, combined))
+            if st.session_state.get('analysis_hash') == analysis_hash:
+                responses = st.session_state['analysis_responses']
+                final_diagnosis = st.session_state['analysis_final_diagnosis']
+            else:
+                # Process the medical report
+                responses, final_diagnosis = process_medical_report(
+                    st.session_state['medical_report'], 
+                    api_key,
+                    model_name,
+                    combined
                 )
-                
-                # Reset session state
-                if st.button("🔄 Analyze Another Report", use_container_width=True):
-                    for key in list(st.session_state.keys()):
-                        if key.startswith('analysis') or key == 'medical_report':
-                            del st.session_state[key]
-                    st.rerun()
+                if responses and final_diagnosis:
+                    st.session_state['analysis_responses'] = responses
+                    st.session_state['analysis_final_diagnosis'] = final_diagnosis
+                    st.session_state['analysis_hash'] = analysis_hash
+                    st.session_state['analysis_timestamp'] = datetime.now()
+                else:
+                    # Don't re-dispatch the agents on every rerun after a failure;
+                    # retrying needs another click on Start Analysis
+                    st.session_state['analysis_started'] = False
+            
+            if responses and final_diagnosis:
+                _results_fragment(responses, final_diagnosis)
         else:
             st.info("👆 Upload a medical report and click 'Start Analysis' to begin.")
     
     # Footer
     st.markdown("---")
-    st.markdown("""
-    <div style='text-align: center; color: #666;'>
-        <p>🏥 AI Medical Report Analysis System | Powered by Google Gemini AI</p>
-        <p><small>⚠️ This tool is for educational purposes only. Always consult with qualified healthcare professionals for medical advice.</small></p>
-    </div>
-    """, unsafe_allow_html=True)
+    st.html(FOOTER_HTML)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Make the project root importable so tests can use the `utils` package
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
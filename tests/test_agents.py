@@ -0,0 +1,80 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from utils.Agents import (
+    MIN_CACHE_CHARS, Cardiologist, MultidisciplinaryTeam, SpecialistPanel,
+    SpecialistReports, build_report_cache
+)
+
+REPORT = "Patient reports chest pain and shortness of breath on exertion."
+
+
+class StubModel:
+    """Stands in for ChatGoogleGenerativeAI through the agents' model= parameter"""
+
+    def __init__(self, chunks=(), fail_after=None, structured=None):
+        self.chunks = list(chunks)
+        self.fail_after = fail_after
+        self.structured = structured
+
+    def _chunks(self):
+        for i, content in enumerate(self.chunks):
+            if i == self.fail_after:
+                raise RuntimeError("stream interrupted")
+            yield SimpleNamespace(content=content)
+
+    def stream(self, prompt):
+        yield from self._chunks()
+
+    async def astream(self, prompt):
+        for chunk in self._chunks():
+            yield chunk
+
+    def with_structured_output(self, schema):
+        return SimpleNamespace(invoke=lambda prompt: self.structured)
+
+
+def test_panel_maps_fields_onto_specialist_names():
+    reports = SpecialistReports(cardiologist="cardiac notes", pulmonologist="lung notes")
+    panel = SpecialistPanel(REPORT, ["Cardiologist", "Pulmonologist"], api_key="test", model=StubModel(structured=reports))
+
+    assert panel.run() == {"Cardiologist": "cardiac notes", "Pulmonologist": "lung notes"}
+
+
+def test_panel_ignores_fields_of_specialists_not_consulted():
+    reports = SpecialistReports(cardiologist="cardiac notes", psychologist="unrequested", pulmonologist="unrequested")
+    panel = SpecialistPanel(REPORT, ["Cardiologist"], api_key="test", model=StubModel(structured=reports))
+
+    assert panel.run() == {"Cardiologist": "cardiac notes"}
+
+
+def test_run_stream_yields_every_chunk():
+    agent = Cardiologist(REPORT, api_key="test", model=StubModel(["Possible ", "angina."]))
+
+    assert "".join(agent.run_stream()) == "Possible angina."
+
+
+def test_broken_run_stream_reraises_instead_of_returning_partial_text():
+    team = MultidisciplinaryTeam("c", "p", "l", api_key="test", model=StubModel(["Partial ", "answer"], fail_after=1))
+    received = []
+
+    with pytest.raises(RuntimeError):
+        for chunk in team.run_stream():
+            received.append(chunk)
+    assert received == ["Partial "]
+
+
+def test_broken_arun_stream_reraises_instead_of_returning_partial_text():
+    agent = Cardiologist(REPORT, api_key="test", model=StubModel(["Partial ", "answer"], fail_after=1))
+
+    async def consume():
+        return [chunk async for chunk in agent.arun_stream()]
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(consume())
+
+
+def test_short_reports_are_not_context_cached():
+    assert build_report_cache("x" * (MIN_CACHE_CHARS - 1), api_key="test") is None
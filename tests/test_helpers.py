@@ -0,0 +1,56 @@
+from utils.Helpers import (
+    MODEL_NAME, SHORT_REPORT_CHARS, SMALL_MODEL_NAME, SPECIALTY_KEYWORDS,
+    format_report, is_report_too_short, select_model_name, select_specialties
+)
+
+
+def test_cardiac_findings_consult_cardiologist():
+    report = "ST depression in leads V4-V6 on exercise stress test"
+    assert select_specialties(report) == ["Cardiologist"]
+
+
+def test_broader_cardiac_vocabulary():
+    report = "Atrial fibrillation, syncope, angina; cough"
+    assert select_specialties(report) == ["Cardiologist", "Pulmonologist"]
+
+
+def test_keywords_match_on_word_boundaries():
+    assert select_specialties("Patient is on supplemental oxygen") == ["Pulmonologist"]
+    assert not SPECIALTY_KEYWORDS["Psychologist"].search("Unremarkable developmental history")
+
+
+def test_psychological_findings_consult_psychologist():
+    report = "Reports low mood, anxiety and insomnia for several months"
+    assert select_specialties(report) == ["Psychologist"]
+
+
+def test_no_matching_keywords_consults_everyone():
+    assert select_specialties("Routine follow-up visit") == list(SPECIALTY_KEYWORDS)
+
+
+def test_short_reports_use_the_small_model():
+    assert select_model_name("x" * (SHORT_REPORT_CHARS - 1)) == SMALL_MODEL_NAME
+    assert select_model_name("x" * SHORT_REPORT_CHARS) == MODEL_NAME
+
+
+def test_model_override_wins():
+    assert select_model_name("short report", override="gemini-1.5-pro") == "gemini-1.5-pro"
+
+
+def test_empty_or_tiny_reports_are_too_short():
+    assert is_report_too_short("")
+    assert is_report_too_short("   \n\t  ")
+    assert is_report_too_short("BP 120/80")
+    assert not is_report_too_short("Patient reports chest pain on exertion.")
+
+
+def test_format_report_includes_every_section():
+    responses = {"Cardiologist": "cardiac notes", "Psychologist": "psych notes"}
+    report = format_report(responses, "final notes", "2024-01-01 12:00:00")
+
+    assert report.startswith("MEDICAL REPORT ANALYSIS\nGenerated on: 2024-01-01 12:00:00")
+    assert "CARDIOLOGIST ANALYSIS:\ncardiac notes" in report
+    assert "PSYCHOLOGIST ANALYSIS:\npsych notes" in report
+    assert "PULMONOLOGIST ANALYSIS:\nNo response" in report
+    assert "FINAL MULTIDISCIPLINARY TEAM ANALYSIS:\nfinal notes" in report
+    assert report.endswith("End of Report")
@@ -0,0 +1,109 @@
+import os
+from pathlib import Path
+
+import pytest
+
+from utils import PdfCache
+from utils.PdfCache import extract_with_disk_cache, private_cache_dir, write_cache_entry
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("PDF_TEXT_DISK_CACHE", "1")
+    return tmp_path / "cache"
+
+
+class CountingParser:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, pdf_bytes):
+        self.calls += 1
+        return f"text of {pdf_bytes.decode()}"
+
+
+def cache_entries(directory):
+    return sorted(path.name for path in directory.iterdir())
+
+
+def test_disk_cache_is_off_by_default(tmp_path, monkeypatch):
+    monkeypatch.delenv("PDF_TEXT_DISK_CACHE", raising=False)
+    parse = CountingParser()
+
+    assert extract_with_disk_cache(b"a", parse, cache_dir=tmp_path / "cache") == "text of a"
+    assert not (tmp_path / "cache").exists()
+
+
+def test_cache_miss_then_hit(cache_dir):
+    parse = CountingParser()
+
+    assert extract_with_disk_cache(b"a", parse, cache_dir=cache_dir) == "text of a"
+    assert extract_with_disk_cache(b"a", parse, cache_dir=cache_dir) == "text of a"
+    assert parse.calls == 1
+    assert os.stat(cache_dir).st_mode & 0o777 == 0o700
+
+
+def test_least_recently_used_entries_are_evicted(cache_dir):
+    parse = CountingParser()
+    for i, name in enumerate([b"a", b"b"]):
+        extract_with_disk_cache(name, parse, cache_dir=cache_dir, max_files=2)
+        entry = next(path for path in cache_dir.iterdir() if path.read_text() == f"text of {name.decode()}")
+        os.utime(entry, (1000 + i, 1000 + i))
+
+    # A hit on "a" makes "b" the least recently used entry
+    extract_with_disk_cache(b"a", parse, cache_dir=cache_dir, max_files=2)
+    extract_with_disk_cache(b"c", parse, cache_dir=cache_dir, max_files=2)
+
+    texts = sorted(path.read_text() for path in cache_dir.iterdir())
+    assert texts == ["text of a", "text of c"]
+
+
+def test_eviction_ignores_files_outside_the_cache(cache_dir):
+    cache_dir.mkdir(mode=0o700)
+    other = cache_dir.parent / "med_other.txt"
+    other.write_text("not ours")
+
+    write_cache_entry(cache_dir, cache_dir / "med_1.txt", "one", max_files=1)
+    write_cache_entry(cache_dir, cache_dir / "med_2.txt", "two", max_files=1)
+
+    assert other.exists()
+    assert cache_entries(cache_dir) == ["med_2.txt"]
+
+
+def test_failed_write_leaves_no_temporary_file(cache_dir, monkeypatch):
+    cache_dir.mkdir(mode=0o700)
+
+    def failing_replace(src, dst):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(PdfCache.os, "replace", failing_replace)
+    write_cache_entry(cache_dir, cache_dir / "med_1.txt", "one")
+
+    assert cache_entries(cache_dir) == []
+
+
+def test_rejects_directory_open_to_other_users(cache_dir):
+    cache_dir.mkdir()
+    os.chmod(cache_dir, 0o755)
+    parse = CountingParser()
+
+    assert private_cache_dir(cache_dir) is None
+    extract_with_disk_cache(b"a", parse, cache_dir=cache_dir)
+    assert cache_entries(cache_dir) == []
+
+
+@pytest.mark.skipif(not hasattr(os, "getuid"), reason="ownership checks need POSIX uids")
+def test_rejects_directory_owned_by_another_user(cache_dir, monkeypatch):
+    cache_dir.mkdir(mode=0o700)
+    owner = os.stat(cache_dir).st_uid
+    monkeypatch.setattr(PdfCache.os, "getuid", lambda: owner + 1)
+
+    assert private_cache_dir(cache_dir) is None
+
+
+def test_rejects_symlinked_directory(cache_dir, tmp_path):
+    target = tmp_path / "elsewhere"
+    target.mkdir(mode=0o700)
+    Path(cache_dir).symlink_to(target)
+
+    assert private_cache_dir(cache_dir) is None
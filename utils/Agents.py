@@ -1,21 +1,108 @@
 from langchain_core.prompts import PromptTemplate
 from langchain_google_genai import ChatGoogleGenerativeAI
+from google import genai as google_genai
+from google.genai import types as genai_types
+from pydantic import BaseModel, Field
+from typing import Optional
 import os
+from utils.Helpers import NOT_CONSULTED_REPORT, MODEL_NAME
+
+# Context caching needs an explicit model version
+CACHE_MODEL_VERSIONS = {
+    "gemini-1.5-flash": "gemini-1.5-flash-001",
+    "gemini-1.5-flash-8b": "gemini-1.5-flash-8b-001",
+    "gemini-1.5-pro": "gemini-1.5-pro-001"
+}
+# Gemini only caches contexts of at least 32,768 tokens (~4 characters per token)
+MIN_CACHE_CHARS = 32768 * 4
+
+def cache_model_name(model_name):
+    """Versioned model name that a context cache for model_name is bound to"""
+    return CACHE_MODEL_VERSIONS.get(model_name, model_name)
+
+def build_report_cache(medical_report, api_key=None, model_name=MODEL_NAME, ttl_minutes=10):
+    """Cache the medical report with Gemini so the specialists share one prefill.
+
+    Returns the cache name, or None if the report is too short to be cached
+    or the caching call fails, in which case agents embed the report as usual.
+    Uses a client per call so concurrent sessions never share API keys.
+    """
+    if len(medical_report) < MIN_CACHE_CHARS:
+        return None
+    try:
+        client = google_genai.Client(api_key=api_key or os.getenv("GOOGLE_API_KEY"))
+        cache = client.caches.create(
+            model=cache_model_name(model_name),
+            config=genai_types.CreateCachedContentConfig(
+                display_name="medical-report",
+                contents=[f"Medical Report: {medical_report}"],
+                ttl=f"{ttl_minutes * 60}s"
+            )
+        )
+        return cache.name
+    except Exception as e:
+        print("Error occurred while caching the report:", e)
+        return None
+
+def delete_report_cache(cache_name, api_key=None):
+    """Remove a cached report from Gemini as soon as it is no longer needed"""
+    try:
+        client = google_genai.Client(api_key=api_key or os.getenv("GOOGLE_API_KEY"))
+        client.caches.delete(name=cache_name)
+    except Exception as e:
+        print("Error occurred while deleting the cached report:", e)
+
+def warm_up_model(model):
+    """Open the model client's connection to Gemini ahead of the first analysis.
+
+    Counting tokens is free and goes through the model's synchronous client,
+    so only synchronous calls (invoke/stream) benefit; the async client is
+    not touched.
+    """
+    try:
+        model.get_num_tokens("Hello")
+        return True
+    except Exception as e:
+        print("Error occurred while warming up the Gemini connection:", e)
+        return False
+
+def create_model(api_key, model_name=MODEL_NAME, cached_content=None):
+    """Create a Gemini chat model client, optionally bound to a cached report"""
+    if cached_content:
+        # The cached report is bound to the model version it was created with
+        return ChatGoogleGenerativeAI(
+            model=cache_model_name(model_name),
+            google_api_key=api_key,
+            temperature=0,
+            cached_content=cached_content
+        )
+    return ChatGoogleGenerativeAI(
+        model=model_name,
+        google_api_key=api_key,
+        temperature=0
+    )
+
+class SpecialistReports(BaseModel):
+    """Structured output of a combined specialist consultation"""
+    cardiologist: Optional[str] = Field(None, description="The cardiologist's possible causes and recommended next steps")
+    psychologist: Optional[str] = Field(None, description="The psychologist's possible mental health issues and recommended next steps")
+    pulmonologist: Optional[str] = Field(None, description="The pulmonologist's possible respiratory issues and recommended next steps")
 
 class Agent:
-    def __init__(self, medical_report=None, role=None, extra_info=None, api_key=None):
+    def __init__(self, medical_report=None, role=None, extra_info=None, api_key=None, cached_content=None, model=None):
         self.medical_report = medical_report
         self.role = role
         self.extra_info = extra_info
+        self.cached_content = cached_content
         self.api_key = api_key or os.getenv("GOOGLE_API_KEY")
         if not self.api_key:
             raise ValueError("API key not found. Set GOOGLE_API_KEY environment variable or pass api_key explicitly.")
         self.prompt_template = self.create_prompt_template()
-        self.model = ChatGoogleGenerativeAI(
-            model="gemini-1.5-flash",  # Use Gemini 1.5 Flash (free tier, 1500 requests/day)
-            google_api_key=self.api_key,
-            temperature=0
-        )
+        if model is not None:
+            # Reuse a model client from the caller (bound to cached_content if set)
+            self.model = model
+        else:
+            self.model = create_model(self.api_key, cached_content=cached_content)
 
     def create_prompt_template(self):
         if self.role == "MultidisciplinaryTeam":
@@ -24,11 +111,23 @@ class Agent:
                 You will receive a medical report of a patient visited by a Cardiologist, Psychologist, and Pulmonologist.
                 Task: Review the patient's medical report from the Cardiologist, Psychologist, and Pulmonologist, analyze them and come up with a list of 3 possible health issues of the patient.
                 Just return a list of bullet points of 3 possible health issues of the patient and for each issue provide the reason.
+                A report that reads "{NOT_CONSULTED_REPORT}" means that specialist did not review the case; do not treat it as a normal or negative finding.
                 
                 Cardiologist Report: {self.extra_info.get('cardiologist_report', '')}
                 Psychologist Report: {self.extra_info.get('psychologist_report', '')}
                 Pulmonologist Report: {self.extra_info.get('pulmonologist_report', '')}
             """
+        elif self.role == "SpecialistPanel":
+            specialties = ", ".join(self.extra_info.get('specialties', []))
+            templates = f"""
+                Act like a panel of medical specialists made up of: {specialties}. You will receive a patient's report.
+                Task: Review the patient's report separately from the point of view of each specialist on the panel.
+                Cardiologist Focus: Identify any subtle signs of cardiac issues, such as arrhythmias or structural abnormalities, and any further cardiac testing or monitoring needed.
+                Psychologist Focus: Identify any potential mental health issues, such as anxiety, depression, or trauma, and how to address them through therapy, counseling, or other interventions.
+                Pulmonologist Focus: Identify any potential respiratory issues, such as asthma, COPD, or lung infections, and any pulmonary function tests, imaging studies, or other interventions needed.
+                For each specialist on the panel, only return the possible issues and the recommended next steps. Leave the fields of specialists not on the panel empty.
+                Patient's Report: {{medical_report}}
+            """
         else:
             templates = {
                 "Cardiologist": """
@@ -59,9 +158,16 @@ class Agent:
             templates = templates[self.role]
         return PromptTemplate.from_template(templates)
 
+    def build_prompt(self):
+        if self.cached_content:
+            medical_report = "(provided in the cached context above)"
+        else:
+            medical_report = self.medical_report
+        return self.prompt_template.format(medical_report=medical_report)
+
     def run(self):
         print(f"{self.role} is running...")
-        prompt = self.prompt_template.format(medical_report=self.medical_report)
+        prompt = self.build_prompt()
         try:
             response = self.model.invoke(prompt)
             return response.content
@@ -69,23 +175,73 @@ class Agent:
             print("Error occurred:", e)
             return None
 
+    def run_stream(self):
+        """Yield the response text chunk by chunk as Gemini generates it.
+
+        Errors are re-raised so a stream that breaks midway is not mistaken
+        for a complete response.
+        """
+        print(f"{self.role} is streaming...")
+        prompt = self.build_prompt()
+        try:
+            for chunk in self.model.stream(prompt):
+                if chunk.content:
+                    yield chunk.content
+        except Exception as e:
+            print("Error occurred:", e)
+            raise
+
+    async def arun_stream(self):
+        """Asynchronously yield the response text chunk by chunk, re-raising errors"""
+        print(f"{self.role} is streaming...")
+        prompt = self.build_prompt()
+        try:
+            async for chunk in self.model.astream(prompt):
+                if chunk.content:
+                    yield chunk.content
+        except Exception as e:
+            print("Error occurred:", e)
+            raise
+
 class Cardiologist(Agent):
-    def __init__(self, medical_report, api_key=None):
-        super().__init__(medical_report, "Cardiologist", api_key=api_key)
+    def __init__(self, medical_report, api_key=None, cached_content=None, model=None):
+        super().__init__(medical_report, "Cardiologist", api_key=api_key, cached_content=cached_content, model=model)
 
 class Psychologist(Agent):
-    def __init__(self, medical_report, api_key=None):
-        super().__init__(medical_report, "Psychologist", api_key=api_key)
+    def __init__(self, medical_report, api_key=None, cached_content=None, model=None):
+        super().__init__(medical_report, "Psychologist", api_key=api_key, cached_content=cached_content, model=model)
 
 class Pulmonologist(Agent):
-    def __init__(self, medical_report, api_key=None):
-        super().__init__(medical_report, "Pulmonologist", api_key=api_key)
+    def __init__(self, medical_report, api_key=None, cached_content=None, model=None):
+        super().__init__(medical_report, "Pulmonologist", api_key=api_key, cached_content=cached_content, model=model)
+
+class SpecialistPanel(Agent):
+    """Consults several specialists in a single structured-output request"""
+    def __init__(self, medical_report, specialties, api_key=None, model=None):
+        extra_info = {"specialties": list(specialties)}
+        super().__init__(medical_report, "SpecialistPanel", extra_info=extra_info, api_key=api_key, model=model)
+
+    def run(self):
+        print(f"{self.role} is running...")
+        prompt = self.build_prompt()
+        try:
+            reports = self.model.with_structured_output(SpecialistReports).invoke(prompt)
+            fields = {
+                "Cardiologist": reports.cardiologist,
+                "Psychologist": reports.psychologist,
+                "Pulmonologist": reports.pulmonologist
+            }
+            # Only specialists on the panel count, whatever else the model filled in
+            return {name: fields[name] for name in self.extra_info["specialties"]}
+        except Exception as e:
+            print("Error occurred:", e)
+            return None
 
 class MultidisciplinaryTeam(Agent):
-    def __init__(self, cardiologist_report, psychologist_report, pulmonologist_report, api_key=None):
+    def __init__(self, cardiologist_report, psychologist_report, pulmonologist_report, api_key=None, model=None):
         extra_info = {
             "cardiologist_report": cardiologist_report,
             "psychologist_report": psychologist_report,
             "pulmonologist_report": pulmonologist_report
         }
-        super().__init__(role="MultidisciplinaryTeam", extra_info=extra_info, api_key=api_key)
\ No newline at end of file
+        super().__init__(role="MultidisciplinaryTeam", extra_info=extra_info, api_key=api_key, model=model)
\ No newline at end of file
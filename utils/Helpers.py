@@ -0,0 +1,73 @@
+import re
+
+# Use Gemini 1.5 Flash (free tier, 1500 requests/day)
+MODEL_NAME = "gemini-1.5-flash"
+# Smaller, lower-latency tier for short reports
+SMALL_MODEL_NAME = "gemini-1.5-flash-8b"
+
+# Reports with fewer characters than this are rejected before any agent runs
+MIN_REPORT_CHARS = 20
+# Reports shorter than this (in characters) are analyzed with the smaller model
+SHORT_REPORT_CHARS = 8000
+
+REPORT_SEPARATOR = "\n\n" + "=" * 50 + "\n\n"
+
+# Keywords that indicate a report is relevant to each specialist. Terms are
+# matched on word boundaries so that e.g. "developmental" doesn't count as "mental"
+SPECIALTY_KEYWORDS = {
+    "Cardiologist": re.compile(
+        r"\b(?:cardi\w*|heart|chest (?:pain|tightness|discomfort)|ecg|ekg|echocardiogra\w*|"
+        r"holter|arrhythmi\w*|palpitations?|blood pressure|hypertensi\w*|hypotensi\w*|"
+        r"troponin|coronary|tachycardi\w*|bradycardi\w*|fibrillation|flutter|angina|"
+        r"syncope|murmurs?|infarct\w*|bnp|nt-probnp|st[- ](?:segment|elevation|depression)|"
+        r"stemi|nstemi|isch(?:a)?emi\w*|stents?|stress test|exercise test|valv\w*|aort\w*|"
+        r"cholesterol|statins?)\b",
+        re.IGNORECASE
+    ),
+    "Psychologist": re.compile(
+        r"\b(?:psych\w*|anxi\w*|(?<!st )(?<!segment )depressi(?:on|ve)|depressed|panic|mood|"
+        r"mental health|mental status|ptsd|insomnia|suicid\w*|self-harm|bipolar|adhd|"
+        r"counsel\w*|phobi\w*|ocd|schizo\w*|burnout)\b",
+        re.IGNORECASE
+    ),
+    "Pulmonologist": re.compile(
+        r"\b(?:pulmon\w*|lungs?|respirat\w*|breath\w*|dyspn\w*|asthma\w*|copd|cough\w*|"
+        r"wheez\w*|spirometr\w*|oxygen|spo2|hypoxi\w*|pneumon\w*|bronch\w*|chest x-ray|"
+        r"chest ct|pleur\w*|emphysema|sputum|inhalers?|tuberculosis|apn(?:o)?ea)\b",
+        re.IGNORECASE
+    )
+}
+
+# Stand-in report for specialists the keyword gate did not consult
+NOT_CONSULTED_REPORT = "Not consulted (no matching keywords)"
+
+def select_specialties(medical_report):
+    """Return the specialists whose keywords appear in the report.
+
+    If nothing matches, the gate can't tell which specialists are needed, so
+    all of them are consulted.
+    """
+    active = [name for name, pattern in SPECIALTY_KEYWORDS.items() if pattern.search(medical_report)]
+    return active or list(SPECIALTY_KEYWORDS)
+
+def is_report_too_short(medical_report):
+    """Whether a report has too little text to be worth analyzing"""
+    return len(medical_report.strip()) < MIN_REPORT_CHARS
+
+def select_model_name(medical_report, override="Auto"):
+    """Pick the Gemini model for a report, honouring the sidebar override"""
+    if override != "Auto":
+        return override
+    return SMALL_MODEL_NAME if len(medical_report) < SHORT_REPORT_CHARS else MODEL_NAME
+
+def format_report(responses, final_diagnosis, timestamp_str):
+    """Build the downloadable analysis report text"""
+    parts = [
+        f"MEDICAL REPORT ANALYSIS\nGenerated on: {timestamp_str}",
+        f"CARDIOLOGIST ANALYSIS:\n{responses.get('Cardiologist', 'No response')}",
+        f"PSYCHOLOGIST ANALYSIS:\n{responses.get('Psychologist', 'No response')}",
+        f"PULMONOLOGIST ANALYSIS:\n{responses.get('Pulmonologist', 'No response')}",
+        f"FINAL MULTIDISCIPLINARY TEAM ANALYSIS:\n{final_diagnosis}",
+        "End of Report"
+    ]
+    return REPORT_SEPARATOR.join(parts)
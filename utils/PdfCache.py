@@ -0,0 +1,70 @@
+import hashlib
+import os
+import stat
+import tempfile
+from pathlib import Path
+
+# Opt-in on-disk cache of extracted PDF text that survives server restarts
+PDF_CACHE_DIR = Path(tempfile.gettempdir()) / "medical-report-analysis-pdf-cache"
+PDF_CACHE_MAX_FILES = 32
+
+def disk_cache_enabled():
+    """Extracted medical text is only written to disk when PDF_TEXT_DISK_CACHE is set"""
+    return os.getenv("PDF_TEXT_DISK_CACHE", "").lower() in ("1", "true", "yes")
+
+def private_cache_dir(cache_dir=PDF_CACHE_DIR):
+    """Return the private cache directory, or None if it can't be trusted.
+
+    The directory lives in the shared temp dir, so it must be a real directory
+    owned by this user and closed to everyone else; otherwise another local
+    user could plant entries in it.
+    """
+    try:
+        cache_dir.mkdir(mode=0o700, exist_ok=True)
+        info = os.lstat(cache_dir)
+    except OSError as e:
+        print("Error occurred while creating the PDF text cache:", e)
+        return None
+    if not stat.S_ISDIR(info.st_mode):
+        return None
+    if hasattr(os, "getuid") and (info.st_uid != os.getuid() or info.st_mode & 0o077):
+        print(f"Not using PDF text cache: {cache_dir} is not private to this user")
+        return None
+    return cache_dir
+
+def write_cache_entry(cache_dir, cache_path, text, max_files=PDF_CACHE_MAX_FILES):
+    """Atomically store extracted text and evict the least recently used entries"""
+    tmp_name = None
+    try:
+        with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=cache_dir, delete=False) as tmp:
+            tmp_name = tmp.name
+            tmp.write(text)
+        os.replace(tmp_name, cache_path)
+        tmp_name = None
+
+        entries = sorted(cache_dir.glob("med_*.txt"), key=lambda path: path.stat().st_mtime)
+        for stale in entries[:-max_files]:
+            stale.unlink(missing_ok=True)
+    except OSError as e:
+        # The disk cache is best-effort; extraction already succeeded
+        print("Error occurred while caching PDF text:", e)
+        if tmp_name:
+            Path(tmp_name).unlink(missing_ok=True)
+
+def extract_with_disk_cache(pdf_bytes, parse, cache_dir=PDF_CACHE_DIR, max_files=PDF_CACHE_MAX_FILES):
+    """Return parse(pdf_bytes), served from and stored in the disk cache when enabled"""
+    directory = private_cache_dir(cache_dir) if disk_cache_enabled() else None
+    if directory is None:
+        return parse(pdf_bytes)
+
+    cache_path = directory / f"med_{hashlib.sha256(pdf_bytes).hexdigest()}.txt"
+    try:
+        text = cache_path.read_text(encoding="utf-8")
+        os.utime(cache_path)  # Mark as recently used
+        return text
+    except OSError:
+        pass
+
+    text = parse(pdf_bytes)
+    write_cache_entry(directory, cache_path, text, max_files)
+    return text